@@ -0,0 +1,57 @@
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend, Value
+import hashlib
+import os
+
+# Point at a shared Redis to let the scraper invalidate the API's cache; otherwise cache in-process
+redis_url = os.environ.get("REDIS_URL")
+
+CACHE_EXPIRE = 300  # seconds
+SEARCH_NAMESPACE = "search"
+# Responses held by the in-process backend; each distinct query/filter/page combination is one entry
+MAX_CACHED_RESPONSES = 1024
+
+class BoundedInMemoryBackend(InMemoryBackend):
+    """InMemoryBackend that drops expired entries on write and holds at most max_entries responses"""
+    
+    def __init__(self, max_entries: int = MAX_CACHED_RESPONSES):
+        # The base class only deletes an expired entry when its own key is read again, and shares
+        # one class-level dict, so every unrepeated query would stay for the life of the process
+        self._store = {}
+        self.max_entries = max_entries
+    
+    async def set(self, key: str, value: bytes, expire=None) -> None:
+        async with self._lock:
+            now = self._now
+            # Re-inserting moves the key to the end, so the store stays ordered oldest first; with one
+            # expiry for every response that is also expiry order, and eviction only looks at the front
+            self._store.pop(key, None)
+            while self._store:
+                oldest = next(iter(self._store))
+                if self._store[oldest].ttl_ts >= now and len(self._store) < self.max_entries:
+                    break
+                del self._store[oldest]
+            self._store[key] = Value(value, now + (expire or 0))
+
+def init_cache():
+    if redis_url:
+        from fastapi_cache.backends.redis import RedisBackend
+        from redis import asyncio as aioredis
+        backend = RedisBackend(aioredis.from_url(redis_url))
+    else:
+        backend = BoundedInMemoryBackend()
+    FastAPICache.init(backend, prefix="rosetta")
+
+def query_key_builder(func, namespace: str = "", *, request=None, response=None, args=(), kwargs=None):
+    """Key on the query parameters only, ignoring injected dependencies such as the DB session"""
+    params = sorted(
+        (name, tuple(sorted(value)) if isinstance(value, list) else value)
+        for name, value in (kwargs or {}).items()
+        if name != "session"
+    )
+    digest = hashlib.md5(repr(params).encode()).hexdigest()
+    return f"{namespace}:{func.__name__}:{digest}"
+
+async def clear_search_cache():
+    """Drop cached /search responses after the catalog changes"""
+    await FastAPICache.clear(namespace=SEARCH_NAMESPACE)
@@ -1,21 +1,222 @@
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy import event, make_url
+from sqlalchemy.pool import StaticPool
+from models import normalize_text
 
+import asyncio
+import itertools
+import logging
 import os
+import sqlite3
 
 sqlite_file_name = "database.db"
 # Allow overriding the database URL via environment variable
 sqlite_url = os.environ.get("DATABASE_URL", f"sqlite:///{sqlite_file_name}")
 
 connect_args = {"check_same_thread": False}
-engine = create_engine(sqlite_url, echo=True, connect_args=connect_args)
+
+# Set SQL_ECHO=1 to log every statement while developing
+sql_echo = bool(os.environ.get("SQL_ECHO"))
+if not sql_echo:
+    # Statement logging is string formatting plus I/O on every query; keep it off even when
+    # a caller configures the root logger at INFO (as scraper.py does)
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+
+# Engines are built lazily and shared by every session so the connection pool survives across requests
+_engine = None
+_engine_url = None
+_async_engine = None
+_async_engine_url = None
+
+def _engine_options():
+    options = {"echo": sql_echo, "connect_args": connect_args, "pool_pre_ping": True}
+    if sqlite_url in ("sqlite://", "sqlite:///:memory:"):
+        # In-memory databases live and die with a single connection
+        options["poolclass"] = StaticPool
+    return options
+
+# Applied to every new connection: WAL lets readers run alongside the scraper's writes,
+# mmap and a larger page cache keep hot pages out of read() syscalls
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",  # 256 MB
+    "PRAGMA cache_size=-65536",  # 64 MB
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+)
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
 
 def get_engine():
-    # Re-create engine if sqlite_url was changed (useful for Modal)
-    return create_engine(sqlite_url, echo=True, connect_args=connect_args)
+    global _engine, _engine_url
+    # Re-create engine only if sqlite_url was changed (useful for Modal)
+    if _engine is None or _engine_url != sqlite_url:
+        _engine = create_engine(sqlite_url, **_engine_options())
+        event.listen(_engine, "connect", _set_sqlite_pragmas)
+        _engine_url = sqlite_url
+    return _engine
+
+def get_async_engine():
+    global _async_engine, _async_engine_url
+    # Same database, driven through aiosqlite so queries don't block the event loop
+    if _async_engine is None or _async_engine_url != sqlite_url:
+        async_url = sqlite_url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+        _async_engine = create_async_engine(async_url, **_engine_options())
+        event.listen(_async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+        _async_engine_url = sqlite_url
+    return _async_engine
+
+# Set READ_REPLICA=1 to serve API reads from an in-memory copy of the database, so searches on a
+# network-attached volume never touch the disk; writers (the scraper) keep using the file
+read_replica = bool(os.environ.get("READ_REPLICA"))
+_replica_generation = itertools.count(1)
+_replica_keeper = None  # keeps the current in-memory copy alive between requests
+_replica_engine = None
+_async_replica_engine = None
+_retired_replica = None  # (engine, async engine, keeper) of the previous copy, freed at the next refresh
+_replica_source_state = None  # _source_state() when the current copy was taken
+
+def _source_state():
+    # Modification time and size of the database and its WAL; any committed write changes one of them
+    path = make_url(sqlite_url).database
+    state = []
+    for suffix in ("", "-wal"):
+        try:
+            stat = os.stat(path + suffix)
+            state.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            state.append(None)
+    return tuple(state)
+
+def _snapshot_database():
+    # memdb databases are shared by every connection in the process that opens the same name
+    name = f"file:/rosetta-replica-{next(_replica_generation)}?vfs=memdb"
+    keeper = sqlite3.connect(name, uri=True, check_same_thread=False)
+    # VACUUM INTO rather than the backup API: a page-for-page copy would carry over the WAL flag,
+    # which an in-memory database cannot open
+    try:
+        source = sqlite3.connect(f"file:{make_url(sqlite_url).database}?mode=ro", uri=True)
+        try:
+            source.execute("VACUUM INTO ?", (name,))
+        finally:
+            source.close()
+    except sqlite3.Error:
+        # Free the half-built copy; the caller keeps serving the previous one
+        keeper.close()
+        raise
+    return name, keeper
+
+async def refresh_read_replica():
+    """Snapshot the on-disk database into a fresh in-memory copy and point the read engines at it"""
+    global _replica_keeper, _replica_engine, _async_replica_engine, _retired_replica, _replica_source_state
+    # Sessions bind to the read engine before their first query, so a retired copy stays open for one
+    # refresh interval; anything still holding it has long since connected
+    if _retired_replica is not None:
+        old_engine, old_async_engine, old_keeper = _retired_replica
+        _retired_replica = None
+        old_engine.dispose()
+        await old_async_engine.dispose()
+        old_keeper.close()
+    
+    # The scraper writes rarely; don't copy the whole file off the volume when nothing has changed
+    state = await asyncio.to_thread(_source_state)
+    if _replica_keeper is not None and state == _replica_source_state:
+        return
+    name, keeper = await asyncio.to_thread(_snapshot_database)
+    
+    # Swap rather than overwrite, so in-flight reads finish against the copy they started on
+    if _replica_keeper is not None:
+        _retired_replica = (_replica_engine, _async_replica_engine, _replica_keeper)
+    options = {"echo": sql_echo, "connect_args": connect_args}
+    _replica_engine = create_engine(f"sqlite:///{name}&uri=true", **options)
+    _async_replica_engine = create_async_engine(f"sqlite+aiosqlite:///{name}&uri=true", **options)
+    _replica_keeper = keeper
+    _replica_source_state = state
+
+def get_read_engine():
+    """Engine for request-path reads: the in-memory replica when enabled, otherwise the database file"""
+    return _replica_engine or get_engine()
+
+def get_async_read_engine():
+    return _async_replica_engine or get_async_engine()
+
+# External-content FTS5 index over midifile, kept in sync by triggers
+FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS midifile_fts USING fts5(
+        title, composer,
+        content='midifile', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS midifile_fts_ai AFTER INSERT ON midifile BEGIN
+        INSERT INTO midifile_fts(rowid, title, composer) VALUES (new.id, new.title, new.composer);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS midifile_fts_ad AFTER DELETE ON midifile BEGIN
+        INSERT INTO midifile_fts(midifile_fts, rowid, title, composer) VALUES ('delete', old.id, old.title, old.composer);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS midifile_fts_au AFTER UPDATE ON midifile BEGIN
+        INSERT INTO midifile_fts(midifile_fts, rowid, title, composer) VALUES ('delete', old.id, old.title, old.composer);
+        INSERT INTO midifile_fts(rowid, title, composer) VALUES (new.id, new.title, new.composer);
+    END""",
+]
+
+def create_fts_index(engine):
+    with engine.begin() as conn:
+        exists = conn.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'midifile_fts'").first()
+        for statement in FTS_DDL:
+            conn.exec_driver_sql(statement)
+        if not exists:
+            # Index rows that were added before the FTS table existed
+            conn.exec_driver_sql("INSERT INTO midifile_fts(midifile_fts) VALUES ('rebuild')")
+
+def backfill_normalized_text(conn):
+    """Add the title_norm/composer_norm columns to older databases and fill any rows missing them"""
+    columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(midifile)")}
+    for name in ("title_norm", "composer_norm"):
+        if name not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE midifile ADD COLUMN {name} VARCHAR")
+    stale = conn.exec_driver_sql(
+        "SELECT id, title, composer FROM midifile WHERE title_norm IS NULL OR composer_norm IS NULL"
+    ).all()
+    if stale:
+        conn.exec_driver_sql(
+            "UPDATE midifile SET title_norm = ?, composer_norm = ? WHERE id = ?",
+            [(normalize_text(title), normalize_text(composer), file_id) for file_id, title, composer in stale],
+        )
+
+# Indexes made redundant by a composite index sharing their leading column
+OBSOLETE_INDEXES = ["ix_midifile_genre"]
 
 def create_db_and_tables():
-    SQLModel.metadata.create_all(get_engine())
+    engine = get_engine()
+    SQLModel.metadata.create_all(engine)
+    # create_all only builds indexes along with new tables, so add any missing ones to existing tables
+    for sql_table in SQLModel.metadata.sorted_tables:
+        for index in sql_table.indexes:
+            index.create(engine, checkfirst=True)
+    with engine.begin() as conn:
+        for name in OBSOLETE_INDEXES:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+        backfill_normalized_text(conn)
+        # file_hash used to be stored as a hex string
+        legacy = conn.exec_driver_sql("SELECT id, file_hash FROM midifile WHERE typeof(file_hash) = 'text'").all()
+        if legacy:
+            conn.exec_driver_sql(
+                "UPDATE midifile SET file_hash = ? WHERE id = ?",
+                [(bytes.fromhex(file_hash), file_id) for file_id, file_hash in legacy],
+            )
+    create_fts_index(engine)
 
 def get_session():
-    with Session(get_engine()) as session:
+    with Session(get_read_engine()) as session:
+        yield session
+
+async def get_async_session():
+    async with AsyncSession(get_async_read_engine()) as session:
         yield session
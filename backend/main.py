@@ -1,31 +1,167 @@
 from fastapi import FastAPI, Depends, Query, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from sqlmodel import Session, select
-from typing import List, Optional
-from database import create_db_and_tables, get_session
-from models import MIDIFile, MIDIFileRead, Tag, Genre, Difficulty, Period
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.orm import selectinload
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import bindparam, column, table, text, union_all
+from sqlalchemy.exc import SQLAlchemyError
+from typing import List, Optional, Tuple
+from database import create_db_and_tables, get_async_session, get_read_engine, get_session, read_replica, refresh_read_replica
+from cache import CACHE_EXPIRE, SEARCH_NAMESPACE, init_cache, query_key_builder
+from models import MIDIFile, MIDIFileRead, Tag, Genre, Difficulty, Period, normalize_text
 import uvicorn
 from contextlib import asynccontextmanager
-from difflib import SequenceMatcher
-
-# Reuse fuzzy match logic from original draft
-def fuzzy_match(query: str, target: str) -> float:
-    """Return similarity score between 0 and 1"""
-    if not target:
-        return 0.0
-    query_lower = query.lower()
-    target_lower = target.lower()
+from fastapi_cache.decorator import cache
+from rapidfuzz import fuzz, process
+import numpy as np
+import asyncio
+import functools
+import heapq
+import logging
+import re
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+# Lightweight handle on the FTS5 table created in database.create_fts_index
+midifile_fts = table("midifile_fts", column("rowid"), column("title"), column("composer"))
+# bm25 column weights, mirroring the 40/30 title/composer split of the fuzzy ranking
+FTS_RANK = text("bm25(midifile_fts, 4.0, 3.0)")
+
+def build_fts_query(query: str) -> Optional[str]:
+    """Turn free text into a safe FTS5 expression of quoted prefix terms"""
+    tokens = re.findall(r"\w+", query)
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+def score_field(query: str, targets: List[str]) -> np.ndarray:
+    """Similarity (0-100) of a normalized query against each normalized target; anything under 60 comes back as 0"""
+    scores = np.zeros(len(targets), dtype=np.float32)
+    query_len = len(query)
+    fits = np.fromiter((len(target) >= query_len for target in targets), dtype=bool, count=len(targets))
+    inside = np.flatnonzero(fits)
+    outside = np.flatnonzero(~fits)
+    if inside.size:
+        # Best-aligned window of each target; exact substrings score 100
+        scores[inside] = process.cdist(
+            [query], [targets[i] for i in inside], scorer=fuzz.partial_ratio, score_cutoff=60, workers=-1
+        )[0]
+    if outside.size:
+        # fuzz.ratio is the normalized Indel similarity scaled to 0-100
+        scores[outside] = process.cdist(
+            [query], [targets[i] for i in outside], scorer=fuzz.ratio, score_cutoff=60, workers=-1
+        )[0]
+    return scores
+
+def score_candidates(query: str, titles: List[str], composers: List[str]) -> np.ndarray:
+    """Combined fuzzy score per candidate row for a normalized query, 0 where neither field reaches the threshold"""
+    # Title match (40 points max) + composer match (30 points max)
+    # Tags would need to be loaded eagerly or joined for efficient searching
+    title_scores = score_field(query, titles)
+    composer_scores = score_field(query, composers)
+    return 0.4 * title_scores + 0.3 * composer_scores
+
+@functools.lru_cache(maxsize=None)
+def search_statement(mode: str, has_difficulty: bool, has_genre: bool, has_period: bool):
+    """
+    /search statement for one combination of hard filters, built once and reused with bound values
+    mode: "page" (plain paginated browse), "fts" (indexed match, ranked and paginated) or "all" (id and normalized text of every filtered row)
+    """
+    if mode == "all":
+        # Fuzzy scoring only needs the normalized text; the winning rows are loaded afterwards by id
+        sql_query = select(MIDIFile.id, MIDIFile.title_norm, MIDIFile.composer_norm)
+    else:
+        # Tags are loaded up front: an async session cannot lazy-load them during serialization
+        sql_query = select(MIDIFile).options(selectinload(MIDIFile.tags))
+    if has_difficulty:
+        sql_query = sql_query.where(MIDIFile.difficulty.in_(bindparam("difficulty", expanding=True)))
+    if has_genre:
+        sql_query = sql_query.where(MIDIFile.genre.in_(bindparam("genre", expanding=True)))
+    if has_period:
+        sql_query = sql_query.where(MIDIFile.period.in_(bindparam("period", expanding=True)))
+    if mode == "fts":
+        sql_query = (
+            sql_query.join(midifile_fts, midifile_fts.c.rowid == MIDIFile.id)
+            .where(text("midifile_fts MATCH :fts_query"))
+            .order_by(FTS_RANK)
+        )
+    if mode != "all":
+        sql_query = sql_query.limit(bindparam("limit")).offset(bindparam("offset"))
+    return sql_query
+
+# Full rows, with tags, for the page chosen by fuzzy ranking
+FILES_BY_ID = select(MIDIFile).options(selectinload(MIDIFile.tags)).where(
+    MIDIFile.id.in_(bindparam("ids", expanding=True))
+)
+
+async def find_midi_files(
+    session: AsyncSession,
+    query: Optional[str],
+    difficulty: Optional[List[Difficulty]],
+    genre: Optional[List[Genre]],
+    period: Optional[List[Period]],
+    limit: int,
+    offset: int,
+) -> List[MIDIFile]:
+    """Filter, match and rank catalog entries for one page of /search"""
+    # 1. Database Filters (Hard filters), bound into a prebuilt statement
+    flags = (bool(difficulty), bool(genre), bool(period))
+    params = {"difficulty": difficulty, "genre": genre, "period": period, "limit": limit, "offset": offset}
+    
+    # Plain browsing: let SQLite paginate straight off the filter indexes
+    if not query:
+        return (await session.exec(search_statement("page", *flags), params=params)).all()
+    
+    # 2. Full-text search, ranked by bm25 inside SQLite
+    fts_query = build_fts_query(query)
+    if fts_query:
+        params["fts_query"] = fts_query
+        fts_sql = search_statement("fts", *flags)
+        page = (await session.exec(fts_sql, params=params)).all()
+        # An empty page past the first one still counts as an indexed hit
+        if page or (offset and (await session.exec(fts_sql, params={**params, "limit": 1, "offset": 0})).first()):
+            return page
+        
+    candidates = (await session.exec(search_statement("all", *flags), params=params)).all()
+    
+    # 3. In-Memory Fuzzy Search & Ranking, only for queries the index cannot match (e.g. typos)
+    # Scoring is CPU-bound; RapidFuzz releases the GIL, so run it off the event loop
+    titles = [row.title_norm for row in candidates]
+    composers = [row.composer_norm for row in candidates]
+    combined = await run_in_threadpool(score_candidates, normalize_text(query), titles, composers)
     
-    if query_lower == target_lower:
-        return 1.0
-    if query_lower in target_lower:
-        return 0.9
-    return SequenceMatcher(None, query_lower, target_lower).ratio()
+    # Only the requested page is ever returned, so select it instead of sorting everything
+    top = heapq.nlargest(offset + limit, np.flatnonzero(combined), key=combined.__getitem__)
+    page_ids = [candidates[i].id for i in top[offset:]]
+    if not page_ids:
+        return []
+    files = {file.id: file for file in (await session.exec(FILES_BY_ID, params={"ids": page_ids})).all()}
+    return [files[file_id] for file_id in page_ids]
+
+async def keep_replica_fresh():
+    """Check once per cache window for the scraper's writes and re-snapshot the read replica when there are any"""
+    while True:
+        await asyncio.sleep(CACHE_EXPIRE)
+        try:
+            await refresh_read_replica()
+        except (sqlite3.Error, SQLAlchemyError, OSError) as e:
+            # Keep serving the previous copy; the next interval tries again
+            logger.error(f"Failed to refresh read replica: {e}")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_db_and_tables()
+    init_cache()
+    if not read_replica:
+        yield
+        return
+    await refresh_read_replica()
+    refresher = asyncio.create_task(keep_replica_fresh())
     yield
+    refresher.cancel()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -44,65 +180,65 @@ app.add_middleware(
 )
 
 @app.get("/search", response_model=List[MIDIFileRead])
-def search_midi_files(
+@cache(expire=CACHE_EXPIRE, namespace=SEARCH_NAMESPACE, key_builder=query_key_builder)
+async def search_midi_files(
     query: Optional[str] = None,
     difficulty: Optional[List[Difficulty]] = Query(None),
     genre: Optional[List[Genre]] = Query(None),
     period: Optional[List[Period]] = Query(None),
     limit: int = 50,
     offset: int = 0,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
-    sql_query = select(MIDIFile)
-    
-    # 1. Database Filters (Hard filters)
-    if difficulty:
-        sql_query = sql_query.where(MIDIFile.difficulty.in_(difficulty))
-    if genre:
-        sql_query = sql_query.where(MIDIFile.genre.in_(genre))
-    if period:
-        sql_query = sql_query.where(MIDIFile.period.in_(period))
-        
-    results = session.exec(sql_query).all()
-    
-    # 2. In-Memory Fuzzy Search & Ranking (if query is present)
-    if query:
-        ranked_results = []
-        for file in results:
-            score = 0.0
-            # Title match
-            title_score = fuzzy_match(query, file.title)
-            if title_score > 0.6: score += title_score * 40
-            
-            # Composer match
-            composer_score = fuzzy_match(query, file.composer)
-            if composer_score > 0.6: score += composer_score * 30
-            
-            # Tag match (simple check for now)
-            # You would need to load tags eagerly or join them for efficient searching
-            
-            if score > 0:
-                ranked_results.append((score, file))
-        
-        ranked_results.sort(key=lambda x: x[0], reverse=True)
-        results = [r[1] for r in ranked_results]
+    files = await find_midi_files(session, query, difficulty, genre, period, limit, offset)
+    # Serialize while the session is open so cached and fresh responses carry the same tags
+    return [MIDIFileRead.model_validate(file) for file in files]
+
+# Prefix-match titles and composers through the FTS index in one round-trip. Each field dedupes and caps
+# its own candidates, so repeated names (one composer's many files) or a busy title branch cannot crowd
+# the other matches out of the pool
+_fts_match = bindparam("fts_query")
+_suggest_titles = select(MIDIFile.title).distinct().where(MIDIFile.id.in_(
+    select(midifile_fts.c.rowid).where(midifile_fts.c.title.op("MATCH")(_fts_match))
+)).limit(bindparam("limit")).subquery()
+_suggest_composers = select(MIDIFile.composer).distinct().where(MIDIFile.id.in_(
+    select(midifile_fts.c.rowid).where(midifile_fts.c.composer.op("MATCH")(_fts_match))
+)).limit(bindparam("limit")).subquery()
+SUGGEST_STATEMENT = union_all(select(_suggest_titles.c.title), select(_suggest_composers.c.composer))
+# Candidates fetched per field per requested suggestion, so ranking has more than the first matches to choose from
+SUGGEST_POOL_FACTOR = 5
+
+def suggestion_rank(query: str):
+    """Sort key for suggestions: prefix matches first, then earlier matches, then shorter strings"""
+    def rank(suggestion: str) -> Tuple[bool, int, int]:
+        text = normalize_text(suggestion)
+        position = text.find(query)
+        return (position != 0, position if position >= 0 else len(text), len(text))
+    return rank
+
+@functools.lru_cache(maxsize=4096)
+def _suggest(query: str, limit: int, epoch: int) -> Tuple[str, ...]:
+    """Autocomplete suggestions held in process memory; a new epoch starts with each cache expiry window"""
+    fts_query = build_fts_query(query)
+    if not fts_query:
+        return ()
     
-    return results[offset : offset + limit]
+    with Session(get_read_engine()) as session:
+        params = {"fts_query": fts_query, "limit": limit * SUGGEST_POOL_FACTOR}
+        matches = session.exec(SUGGEST_STATEMENT, params=params).scalars().all()
+    # dict.fromkeys drops names that match as both title and composer; only the top `limit` are ordered
+    candidates = dict.fromkeys(matches)
+    return tuple(heapq.nsmallest(limit, candidates, key=suggestion_rank(normalize_text(query))))
 
 @app.get("/autocomplete", response_model=List[str])
-def autocomplete(query: str, limit: int = 10, session: Session = Depends(get_session)):
+def autocomplete(query: str, limit: int = 10):
+    query = query.lower().strip()
     if len(query) < 2:
         return []
-    
-    # Simple SQL LIKE for autocomplete
-    statement = select(MIDIFile.title).where(MIDIFile.title.ilike(f"%{query}%")).limit(limit)
-    titles = session.exec(statement).all()
-    
-    statement_comp = select(MIDIFile.composer).where(MIDIFile.composer.ilike(f"%{query}%")).limit(limit)
-    composers = session.exec(statement_comp).all()
-    
-    suggestions = sorted(list(set(titles + composers)))
-    return suggestions[:limit]
+    # Served from _suggest's in-process LRU alone: a response-cache lookup (a Redis GET when REDIS_URL
+    # is set) on every keystroke would cost as much as the miss it saves. Short prefixes dominate
+    # keystroke traffic, so most calls never reach the database
+    return list(_suggest(query, limit, int(time.monotonic() // CACHE_EXPIRE)))
 
 @app.get("/files/{file_id}", response_model=MIDIFileRead)
 def get_file(file_id: int, session: Session = Depends(get_session)):
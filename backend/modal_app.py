@@ -11,8 +11,14 @@ image = (
         "uvicorn",
         "sqlmodel",
         "aiohttp",
-        "beautifulsoup4",
-        "python-multipart"
+        "selectolax",
+        "python-multipart",
+        "rapidfuzz",
+        "numpy>=2",
+        "fastapi-cache2[redis]",
+        "aiosqlite",
+        "blake3",
+        "Brotli"
     )
     # Add local backend directory to the image
     .add_local_dir("/Users/themuseicon/rosetta.fun/backend", remote_path="/root/backend")
@@ -26,7 +32,7 @@ app = modal.App("rosetta-midi-search", image=image)
 
 @app.function(
     volumes={"/data": volume},
-    env={"DATABASE_URL": "sqlite:////data/database.db"}
+    env={"DATABASE_URL": "sqlite:////data/database.db", "READ_REPLICA": "1"}
 )
 @modal.asgi_app()
 def web_app():
@@ -46,7 +52,7 @@ def web_app():
 @app.function(
     schedule=modal.Period(days=1),
     volumes={"/data": volume},
-    env={"DATABASE_URL": "sqlite:////data/database.db"}
+    env={"DATABASE_URL": "sqlite:////data/database.db", "SCRAPER_ETAG_CACHE": "/data/etags.json"}
 )
 async def run_scraper():
     import sys
@@ -1,7 +1,11 @@
 from typing import List, Optional
 from sqlmodel import Field, SQLModel, Relationship
+from sqlalchemy import Index, LargeBinary
+from pydantic import field_validator
 from datetime import datetime
 from enum import Enum
+import re
+import unicodedata
 
 class Difficulty(str, Enum):
     BEGINNER = "beginner"
@@ -27,10 +31,18 @@ class Period(str, Enum):
     MODERN = "modern"
     CONTEMPORARY = "contemporary"
 
+_NON_ALNUM = re.compile(r"[\W_]+")
+
+def normalize_text(value: str) -> str:
+    """Fold case, accents and punctuation for fuzzy matching ("Für Elise!" -> "fur elise")"""
+    decomposed = unicodedata.normalize("NFKD", value)
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return _NON_ALNUM.sub(" ", stripped).strip().lower()
+
 class MIDIFileBase(SQLModel):
     title: str = Field(index=True)
     composer: str = Field(index=True)
-    genre: Genre = Field(default=Genre.OTHER, index=True)
+    genre: Genre = Field(default=Genre.OTHER)  # leading column of ix_midifile_filters
     period: Optional[Period] = Field(default=None, index=True)
     difficulty: Difficulty = Field(default=Difficulty.INTERMEDIATE, index=True)
     tempo: Optional[int] = None  # BPM
@@ -43,7 +55,7 @@ class MIDIFileBase(SQLModel):
     source_url: str
     download_url: str
     file_type: str = Field(default="midi") # midi, musicxml
-    file_hash: str = Field(unique=True, index=True)
+    file_hash: bytes = Field(sa_type=LargeBinary(16), unique=True, index=True)  # raw 16-byte digest
     date_added: datetime = Field(default_factory=datetime.utcnow)
 
 class MIDIFileTagLink(SQLModel, table=True):
@@ -51,7 +63,16 @@ class MIDIFileTagLink(SQLModel, table=True):
     tag_id: Optional[int] = Field(default=None, foreign_key="tag.id", primary_key=True)
 
 class MIDIFile(MIDIFileBase, table=True):
+    # /search combines all three hard filters; the scraper looks files up by where they were downloaded from
+    __table_args__ = (
+        Index("ix_midifile_filters", "genre", "period", "difficulty"),
+        Index("ix_midifile_source_download", "source", "download_url"),
+    )
+    
     id: Optional[int] = Field(default=None, primary_key=True)
+    # normalize_text() of title/composer, written once at insert so searches never re-normalize rows
+    title_norm: Optional[str] = None
+    composer_norm: Optional[str] = None
     tags: List["Tag"] = Relationship(back_populates="midi_files", link_model=MIDIFileTagLink)
 
 class Tag(SQLModel, table=True):
@@ -64,4 +85,10 @@ class MIDIFileCreate(MIDIFileBase):
 
 class MIDIFileRead(MIDIFileBase):
     id: int
+    file_hash: str  # hex, as JSON has no bytes type
     tags: List[Tag] = []
+    
+    @field_validator("file_hash", mode="before")
+    @classmethod
+    def hash_to_hex(cls, value):
+        return value.hex() if isinstance(value, bytes) else value
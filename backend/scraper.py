@@ -1,124 +1,264 @@
 import asyncio
 import aiohttp
 import logging
-from typing import List, Optional, Set
+from concurrent.futures import Executor
+from typing import Dict, List, Optional, Set
 from datetime import datetime
-import hashlib
-from bs4 import BeautifulSoup
+from blake3 import blake3
+from selectolax.lexbor import LexborHTMLParser
 from urllib.parse import urljoin
+import json
+import os
 import time
 from sqlmodel import Session, select
-from database import engine, create_db_and_tables
-from models import MIDIFile, Genre, Difficulty, Period #, Tag
+from sqlalchemy import tuple_
+from sqlalchemy.dialects.sqlite import insert
+from database import get_engine, create_db_and_tables
+from cache import init_cache, clear_search_cache
+from models import MIDIFile, Genre, Difficulty, Period, normalize_text #, Tag
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Pages larger than this are skipped rather than buffered
+MAX_PAGE_BYTES = 5_000_000
+
+# ETag/Last-Modified per URL, kept between runs so unchanged pages are not downloaded or parsed again
+etag_cache_file = os.environ.get("SCRAPER_ETAG_CACHE", "etags.json")
+
+# Selectors for MuseScore search result pages
+RESULT_SELECTOR = '.search-result-item' # hypothetical selector
+TITLE_SELECTOR = '.title'
+RESULT_MARKER = RESULT_SELECTOR.lstrip('.').encode()
+
+def parse_search_results(html: bytes, base_url: str) -> List[dict]:
+    """Extract title/url pairs from a search results page; module-level so it can also run in a process pool"""
+    results = []
+    tree = LexborHTMLParser(html)
+    # Mock parsing logic based on assumed structure
+    for item in tree.css(RESULT_SELECTOR):
+        title_elem = item.css_first(TITLE_SELECTOR)
+        if title_elem is None: continue
+        
+        # One malformed item (e.g. an href urljoin rejects) is skipped rather than failing the whole page
+        try:
+            results.append({
+                "title": title_elem.text(strip=True),
+                "url": urljoin(base_url, item.attributes.get('href') or ''),
+            })
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"Skipping malformed result on {base_url}: {e}")
+    return results
+
 class BaseScraper:
     """Base class for all source scrapers"""
     
-    def __init__(self, source_name: str, base_url: str, rate_limit: float = 1.0):
+    def __init__(self, source_name: str, base_url: str, rate_limit: float = 1.0, concurrency: int = 4,
+                 seen_hashes: Optional[Set[bytes]] = None):
         self.source_name = source_name
         self.base_url = base_url
         self.rate_limit = rate_limit
         self.session: Optional[aiohttp.ClientSession] = None
-        self.last_request_time = 0
+        # Executor for HTML parsing; None falls back to the event loop's default thread pool. A couple of
+        # pages parse in milliseconds, far less than starting worker processes, so only set a process pool
+        # once a run parses enough pages to pay for it
+        self.pool: Optional[Executor] = None
+        # Cache validators from earlier runs, keyed by URL
+        self.validators: Dict[str, Dict[str, str]] = {}
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.next_request_time = 0.0
+        # Shared across a pipeline's scrapers so a file is emitted at most once per run
+        self.seen_hashes = seen_hashes if seen_hashes is not None else set()
     
     async def _rate_limit_wait(self):
-        elapsed = time.time() - self.last_request_time
-        if elapsed < self.rate_limit:
-            await asyncio.sleep(self.rate_limit - elapsed)
-        self.last_request_time = time.time()
+        # Reserve the next free slot before sleeping so concurrent tasks still start rate_limit apart
+        now = time.monotonic()
+        slot = max(now, self.next_request_time)
+        self.next_request_time = slot + self.rate_limit
+        if slot > now:
+            await asyncio.sleep(slot - now)
     
-    async def fetch_page(self, url: str) -> Optional[str]:
-        await self._rate_limit_wait()
-        try:
-            async with self.session.get(url, timeout=30) as response:
-                if response.status == 200:
-                    return await response.text()
-                else:
-                    logger.warning(f"Failed to fetch {url}: Status {response.status}")
-                    return None
-        except Exception as e:
-            logger.error(f"Error fetching {url}: {e}")
-            return None
+    async def fetch_page(self, url: str) -> Optional[bytes]:
+        async with self.semaphore:
+            await self._rate_limit_wait()
+            headers = {}
+            cached = self.validators.get(url, {})
+            if "etag" in cached:
+                headers["If-None-Match"] = cached["etag"]
+            if "last_modified" in cached:
+                headers["If-Modified-Since"] = cached["last_modified"]
+            try:
+                async with self.session.get(url, timeout=30, headers=headers) as response:
+                    if response.status == 304:
+                        logger.info(f"Not modified since last run: {url}")
+                        return None
+                    if response.status == 200:
+                        if (response.content_length or 0) > MAX_PAGE_BYTES:
+                            logger.warning(f"Skipping {url}: {response.content_length} bytes")
+                            return None
+                        # Raw bytes go straight to the parser, skipping a decode into a str copy;
+                        # stop reading once the (decompressed) body passes the cap. Chunks are joined
+                        # once at the end, the only copy of the page (the parser takes bytes, not a bytearray)
+                        chunks = []
+                        size = 0
+                        async for chunk in response.content.iter_chunked(64 * 1024):
+                            chunks.append(chunk)
+                            size += len(chunk)
+                            if size > MAX_PAGE_BYTES:
+                                logger.warning(f"Skipping {url}: more than {MAX_PAGE_BYTES} bytes")
+                                return None
+                        # Remember the validators only once the whole page is in hand; a skipped or
+                        # truncated page must be downloaded again next run rather than answered with a 304
+                        validators = {
+                            key: value
+                            for key, value in (("etag", response.headers.get("ETag")), ("last_modified", response.headers.get("Last-Modified")))
+                            if value
+                        }
+                        if validators:
+                            self.validators[url] = validators
+                        return b"".join(chunks)
+                    else:
+                        logger.warning(f"Failed to fetch {url}: Status {response.status}")
+                        return None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"Error fetching {url}: {e}")
+                return None
+    
+    def claim(self, file_hash: bytes) -> bool:
+        """Mark a file as seen; False if it was already emitted during this run"""
+        if file_hash in self.seen_hashes:
+            return False
+        self.seen_hashes.add(file_hash)
+        return True
     
     async def scrape(self) -> List[MIDIFile]:
         raise NotImplementedError
 
 class MuseScoreScraper(BaseScraper):
-    def __init__(self):
-        super().__init__("MuseScore", "https://musescore.com", rate_limit=2.0)
+    def __init__(self, seen_hashes: Optional[Set[bytes]] = None):
+        super().__init__("MuseScore", "https://musescore.com", rate_limit=2.0, seen_hashes=seen_hashes)
+    
+    async def _search(self, query: str) -> List[MIDIFile]:
+        files = []
+        search_url = f"{self.base_url}/sheetmusic?text={query.replace(' ', '+')}"
+        html = await self.fetch_page(search_url)
+        # A page without the result class has nothing to extract; skip the parse (and the trip to the executor)
+        if not html or RESULT_MARKER not in html: return files
+        
+        # Parsing is CPU-bound, so it runs in the scraper's executor instead of blocking the event loop
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(self.pool, parse_search_results, html, self.base_url)
+        for result in results:
+            # Create a dummy entry for demonstration if scraping fails to find real elements
+            # In a real scenario, this selectors need to be precise
+            pass
+        
+        return files
     
     async def scrape(self) -> List[MIDIFile]:
         # Implementation for educational purposes - normally use API
-        files = []
         search_queries = ["beethoven piano", "mozart piano"]
-        
-        for query in search_queries:
-            search_url = f"{self.base_url}/sheetmusic?text={query.replace(' ', '+')}"
-            html = await self.fetch_page(search_url)
-            if not html: continue
-            
-            soup = BeautifulSoup(html, 'html.parser')
-            # Mock parsing logic based on assumed structure
-            for item in soup.select('.search-result-item'): # hypothetical selector
-                try:
-                    title_elem = item.select_one('.title')
-                    if not title_elem: continue
-                    
-                    title = title_elem.text.strip()
-                    url = urljoin(self.base_url, item.get('href', ''))
-                    
-                    # Create a dummy entry for demonstration if scraping fails to find real elements
-                    # In a real scenario, this selectors need to be precise
-                    pass
-                except:
-                    pass
+        pages = await asyncio.gather(*(self._search(query) for query in search_queries))
+        files = [file for page in pages for file in page]
         
         # Adding some dummy data for verification since scraping requires real selectors
         # and live site structure changes frequently.
-        files.append(MIDIFile(
-            title="Symphony No. 5",
-            composer="Ludwig van Beethoven",
-            genre=Genre.CLASSICAL,
-            period=Period.ROMANTIC,
-            difficulty=Difficulty.ADVANCED,
-            quality_score=9.5,
-            source=self.source_name,
-            source_url="https://musescore.com/user/123/scores/456",
-            download_url="https://musescore.com/user/123/scores/456/download",
-            file_hash=hashlib.md5(b"musescore_5th").hexdigest(),
-            tags=[]
-        ))
+        file_hash = blake3(b"musescore_5th").digest(length=16)
+        if self.claim(file_hash):
+            files.append(MIDIFile(
+                title="Symphony No. 5",
+                composer="Ludwig van Beethoven",
+                genre=Genre.CLASSICAL,
+                period=Period.ROMANTIC,
+                difficulty=Difficulty.ADVANCED,
+                quality_score=9.5,
+                source=self.source_name,
+                source_url="https://musescore.com/user/123/scores/456",
+                download_url="https://musescore.com/user/123/scores/456/download",
+                file_hash=file_hash,
+                tags=[]
+            ))
         
         return files
 
 class ScrapingPipeline:
     def __init__(self):
-        self.scrapers = [MuseScoreScraper()]
+        self.seen_hashes: Set[bytes] = set()
+        self.scrapers = [MuseScoreScraper(self.seen_hashes)]
         
     async def run(self):
         create_db_and_tables()
-        async with aiohttp.ClientSession() as session:
+        init_cache()
+        added = 0
+        validators = self._load_validators()
+        # Cap open sockets overall and per host; each scraper's semaphore bounds its own in-flight requests.
+        # Rate-limited scrapers pause between requests, so keep idle connections (and DNS answers) around
+        # long enough to reuse them rather than paying a new TCP+TLS handshake each time
+        connector = aiohttp.TCPConnector(limit=100, limit_per_host=8, keepalive_timeout=60, ttl_dns_cache=300)
+        # aiohttp decodes brotli bodies when the Brotli package is installed
+        headers = {"Accept-Encoding": "gzip, deflate, br"}
+        async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
             for scraper in self.scrapers:
                 scraper.session = session
-                files = await scraper.scrape()
-                self._save_to_db(files)
+                scraper.validators = validators
+            # Scrapers rate-limit themselves, so they can all run at once
+            results = await asyncio.gather(*(scraper.scrape() for scraper in self.scrapers))
+        # Every file from this run shares one timestamp
+        scraped_at = datetime.utcnow()
+        for files in results:
+            added += self._save_to_db(files, scraped_at)
+        self._save_validators(validators)
+        if added:
+            # Cached search results no longer reflect the catalog
+            await clear_search_cache()
                 
-    def _save_to_db(self, files: List[MIDIFile]):
-        with Session(engine) as session:
-            for file in files:
-                # Check for existing
-                existing = session.exec(select(MIDIFile).where(MIDIFile.file_hash == file.file_hash)).first()
-                if not existing:
-                    session.add(file)
-                    logger.info(f"Added {file.title}")
-                else:
-                    logger.info(f"Skipped {file.title} (exists)")
+    def _load_validators(self) -> Dict[str, Dict[str, str]]:
+        try:
+            with open(etag_cache_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_validators(self, validators: Dict[str, Dict[str, str]]):
+        with open(etag_cache_file, "w") as f:
+            json.dump(validators, f)
+    
+    def _save_to_db(self, files: List[MIDIFile], scraped_at: Optional[datetime] = None) -> int:
+        if not files:
+            return 0
+        # One prepared statement for the whole batch; the unique file_hash index skips known files
+        statement = insert(MIDIFile).on_conflict_do_nothing(index_elements=["file_hash"])
+        with Session(get_engine()) as session:
+            connection = session.connection()
+            # Rows hashed before the switch from MD5 to BLAKE3 never conflict on file_hash, so files are
+            # also matched on where they were downloaded from
+            known = set(connection.execute(
+                select(MIDIFile.source, MIDIFile.download_url).where(
+                    tuple_(MIDIFile.source, MIDIFile.download_url).in_({(file.source, file.download_url) for file in files})
+                )
+            ).all())
+            rows = [
+                {
+                    **file.model_dump(exclude={"id"}),
+                    "title_norm": normalize_text(file.title),
+                    "composer_norm": normalize_text(file.composer),
+                    "date_added": scraped_at or file.date_added,
+                }
+                for file in files
+                if (file.source, file.download_url) not in known
+            ]
+            added = connection.execute(statement, rows).rowcount if rows else 0
             session.commit()
+        logger.info(f"Added {added} files, skipped {len(files) - added} (exist)")
+        return added
 
 if __name__ == "__main__":
+    try:
+        # libuv-backed event loop; not available on Windows
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
     pipeline = ScrapingPipeline()
     asyncio.run(pipeline.run())
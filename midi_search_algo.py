@@ -7,7 +7,8 @@ from dataclasses import dataclass
 from typing import List, Optional, Dict, Any
 from enum import Enum
 import re
-from difflib import SequenceMatcher
+import numpy as np
+from rapidfuzz import fuzz, process
 
 class Difficulty(Enum):
     BEGINNER = 1
@@ -33,7 +34,7 @@ class Period(Enum):
     MODERN = "modern"
     CONTEMPORARY = "contemporary"
 
-@dataclass
+@dataclass(slots=True)
 class MIDIFile:
     id: str
     title: str
@@ -52,7 +53,7 @@ class MIDIFile:
     source: str
     date_added: str
 
-@dataclass
+@dataclass(slots=True)
 class SearchFilters:
     difficulty: Optional[List[Difficulty]] = None
     genre: Optional[List[Genre]] = None
@@ -64,16 +65,142 @@ class SearchFilters:
     file_format: Optional[str] = None  # 'midi', 'musicxml', or 'both'
     min_quality: Optional[float] = None
 
-@dataclass
+@dataclass(slots=True)
+class Highlights:
+    """Matched text per field, None where the field did not match"""
+    title: Optional[str] = None
+    composer: Optional[str] = None
+    tag: Optional[str] = None
+    
+    def to_dict(self) -> Dict[str, str]:
+        """The field -> matched text mapping, with the matched tag under 'tags'"""
+        fields = (('title', self.title), ('composer', self.composer), ('tags', self.tag))
+        return {name: text for name, text in fields if text is not None}
+
+@dataclass(slots=True)
 class SearchResult:
     file: MIDIFile
     relevance_score: float
-    match_highlights: Dict[str, str]  # field -> matched text
+    match_highlights: Highlights
+
+# Column codes for enum fields and file formats
+GENRE_CODES = {genre: code for code, genre in enumerate(Genre)}
+PERIOD_CODES = {period: code for code, period in enumerate(Period)}
+FORMAT_BITS = {'midi': 1, 'musicxml': 2}
+# Variable-width string dtype (numpy >= 2) for the text columns
+STRING = np.dtypes.StringDType()
+# Lowercased enum names, in code order, for matching the query against genre and period
+GENRE_NAMES = [genre.value.lower() for genre in Genre]
+PERIOD_NAMES = [period.value.lower() for period in Period]
+
+# Sort column and direction for each sort_by option ("relevance" sorts by the computed score)
+SORT_COLUMNS = {
+    "popularity": ("_downloads", True),
+    "rating": ("_rating", True),
+    "quality": ("_quality", True),
+    "title": ("_titles", False),
+    "composer": ("_composers", False),
+    "recent": ("_date_rank", True),
+}
+
+def _score_kernel(title_sim: np.ndarray, composer_sim: np.ndarray, tag_sim: np.ndarray,
+                  genre_hit: np.ndarray, period_hit: np.ndarray, quality: np.ndarray,
+                  downloads: np.ndarray, rating: np.ndarray) -> np.ndarray:
+    """Relevance arithmetic for many files at once; each argument holds one entry per file"""
+    score = np.zeros(len(quality))
+    
+    # Title match (40 points max)
+    score += np.where(title_sim > 0.6, title_sim * 40, 0.0)
+    
+    # Composer match (30 points max)
+    score += np.where(composer_sim > 0.6, composer_sim * 30, 0.0)
+    
+    # Tag match (15 points max)
+    score += np.where(tag_sim > 0.6, tag_sim * 15, 0.0)
+    
+    # Genre match (10 points max)
+    score += np.where(genre_hit, 10.0, 0.0)
+    
+    # Period match (5 points max)
+    score += np.where(period_hit, 5.0, 0.0)
+    
+    # Quality boost (multiply by quality factor)
+    score *= 0.5 + (quality / 20)  # 0.5 to 1.0
+    
+    # Popularity boost (small influence)
+    score *= 1 + np.minimum(downloads / 10000, 0.2)  # Max 0.2 boost
+    
+    # User rating boost
+    score *= 1 + (rating / 5) * 0.1  # Max 0.1 boost
+    
+    return score
 
 class MIDISearchEngine:
     def __init__(self, files: List[MIDIFile]):
         self.files = files
         self.composer_aliases = self._build_composer_aliases()
+        # Flattened alias table: every lowercased alias or canonical name -> canonical name
+        self._alias_to_canonical: Dict[str, str] = {}
+        for canonical, aliases in self.composer_aliases.items():
+            for name in (*aliases, canonical.lower()):
+                self._alias_to_canonical.setdefault(name, canonical)
+        
+        # Filterable fields as numpy columns, so filters are vectorized tests instead of a loop over files
+        self._difficulty = np.array([f.difficulty.value for f in files], dtype=np.uint8)
+        self._genre = np.array([GENRE_CODES[f.genre] for f in files], dtype=np.uint8)
+        self._period = np.array([PERIOD_CODES[f.period] if f.period else -1 for f in files], dtype=np.int8)
+        self._tempo = np.array([f.tempo for f in files], dtype=np.int32)
+        self._duration = np.array([f.duration for f in files], dtype=np.float64)
+        self._quality = np.array([f.quality_score for f in files], dtype=np.float64)
+        self._downloads = np.array([f.download_count for f in files], dtype=np.int64)
+        self._rating = np.array([f.user_rating for f in files], dtype=np.float64)
+        self._formats = np.array(
+            [sum(FORMAT_BITS.get(fmt, 0) for fmt in set(f.file_formats)) for f in files], dtype=np.uint8
+        )
+        # date_added as its rank among all dates, so "recent" sorts numerically like the other columns
+        self._date_rank = np.unique([f.date_added for f in files], return_inverse=True)[1]
+        
+        # Value counts and sorted copies of the filter columns, to estimate how much each filter keeps
+        self._difficulty_counts = np.bincount(self._difficulty, minlength=max(d.value for d in Difficulty) + 1)
+        self._genre_counts = np.bincount(self._genre, minlength=len(Genre))
+        self._period_counts = np.bincount(self._period + 1, minlength=len(Period) + 1)
+        self._format_counts = np.bincount(self._formats, minlength=sum(FORMAT_BITS.values()) + 1)
+        self._tempo_sorted = np.sort(self._tempo)
+        self._duration_sorted = np.sort(self._duration)
+        self._quality_sorted = np.sort(self._quality)
+        
+        # Lowercased search fields, built once so each search scores the whole corpus in a few C-level passes
+        # Titles and tags are matched against the same query, so they share one array: every title,
+        # then every tag, with files[i] owning tags _text[n + _tag_offsets[i]:n + _tag_offsets[i + 1]].
+        # Variable-width strings: a fixed-width array would pad every entry to the longest one
+        self._text = np.array(
+            [f.title.lower() for f in files] + [tag.lower() for f in files for tag in f.tags], dtype=STRING
+        )
+        self._text_lengths = np.strings.str_len(self._text)
+        self._titles = self._text[:len(files)]
+        self._tag_counts = np.array([len(f.tags) for f in files], dtype=np.intp)
+        self._tag_offsets = np.concatenate(([0], np.cumsum(self._tag_counts)))
+        self._composers = np.array([f.composer.lower() for f in files], dtype=STRING)
+        # Composers repeat heavily, so each distinct name is scored once and gathered per file
+        self._composer_names, self._composer_idx = np.unique(self._composers, return_inverse=True)
+        self._composer_lengths = np.strings.str_len(self._composer_names)
+        
+        # Distinct autocomplete candidates and a trigram index over them, so a lookup only
+        # checks strings sharing every trigram of the query instead of scanning the corpus
+        self._suggestions = list(dict.fromkeys(
+            field for f in files for field in (f.title, f.composer, *f.tags)
+        ))
+        self._suggestions_lower = [suggestion.lower() for suggestion in self._suggestions]
+        self._trigrams: Dict[str, set] = {}
+        for i, suggestion in enumerate(self._suggestions_lower):
+            for trigram in self._trigrams_of(suggestion):
+                self._trigrams.setdefault(trigram, set()).add(i)
+        # (lowercased query, indices of the suggestions containing it) from the last autocomplete call
+        self._last_autocomplete = ("", [])
+    
+    @staticmethod
+    def _trigrams_of(text: str) -> set:
+        return {text[i:i + 3] for i in range(len(text) - 2)}
     
     def _build_composer_aliases(self) -> Dict[str, List[str]]:
         """Map composer variations to canonical names"""
@@ -90,139 +217,188 @@ class MIDISearchEngine:
     
     def _normalize_composer(self, query: str) -> str:
         """Convert composer query to canonical name"""
-        query_lower = query.lower()
-        for canonical, aliases in self.composer_aliases.items():
-            if query_lower in aliases or query_lower == canonical.lower():
-                return canonical
-        return query
+        return self._alias_to_canonical.get(query.lower(), query)
     
-    def _fuzzy_match(self, query: str, target: str, threshold: float = 0.6) -> float:
-        """Return similarity score between 0 and 1"""
+    def _fuzzy_match(self, query: str, targets: np.ndarray, lengths: np.ndarray,
+                     threshold: float = 0.6) -> np.ndarray:
+        """Return similarity scores between 0 and 1 of query against each (lowercased) target"""
         query_lower = query.lower()
-        target_lower = target.lower()
+        scores = np.zeros(len(targets))
         
-        # Exact match
-        if query_lower == target_lower:
-            return 1.0
+        # fuzz.ratio can be at most 2 * min(len) / (sum of lengths), so targets whose length is too far
+        # from the query's cannot reach the threshold and are not worth scoring
+        query_length = len(query_lower)
+        reachable = 2 * np.minimum(lengths, query_length) >= threshold * (lengths + query_length)
+        candidates = np.flatnonzero(reachable)
+        
+        # Fuzzy similarity (bit-parallel Levenshtein); anything under the threshold scores 0
+        if len(candidates):
+            scores[candidates] = process.cdist(
+                [query_lower], targets[candidates], scorer=fuzz.ratio,
+                score_cutoff=threshold * 100, dtype=np.float64, workers=-1
+            )[0] / 100
         
         # Contains match
-        if query_lower in target_lower:
-            return 0.9
+        scores[np.strings.find(targets, query_lower) >= 0] = 0.9
         
-        # Fuzzy similarity
-        return SequenceMatcher(None, query_lower, target_lower).ratio()
+        # Exact match
+        scores[targets == query_lower] = 1.0
+        return scores
     
-    def _calculate_relevance_score(self, file: MIDIFile, query: str, 
-                                   sort_by: str = "relevance") -> float:
+    def _match_scores(self, query: str, idx: np.ndarray):
         """
-        Calculate relevance score based on multiple factors
+        Similarity of the query to the title, composer and tags of each file at idx
+        Titles and tags are scored together in a single pass; tag scores come back flat, with
+        the tags of idx[j] at tag_offsets[j]:tag_offsets[j + 1]
+        """
+        counts = self._tag_counts[idx]
+        tag_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.intp)
+        if len(idx) == len(self.files):
+            # Nothing filtered out: score the shared array as is instead of gathering a copy
+            scores = self._fuzzy_match(query, self._text, self._text_lengths)
+        else:
+            # Positions of the tags of the files at idx, file by file
+            tag_positions = np.repeat(self._tag_offsets[idx] - tag_offsets[:-1], counts) + np.arange(tag_offsets[-1])
+            positions = np.concatenate((idx, len(self.files) + tag_positions))
+            scores = self._fuzzy_match(query, self._text[positions], self._text_lengths[positions])
+        title_scores, tag_scores = scores[:len(idx)], scores[len(idx):]
+        
+        composer_scores = self._fuzzy_match(
+            self._normalize_composer(query), self._composer_names, self._composer_lengths
+        )[self._composer_idx[idx]]
+        return title_scores, composer_scores, tag_scores, tag_offsets
+    
+    @staticmethod
+    def _best_tag_scores(tag_scores: np.ndarray, tag_offsets: np.ndarray) -> np.ndarray:
+        """Best tag similarity per file (0 for files without tags), from flat scores and segment offsets"""
+        has_tags = np.diff(tag_offsets) > 0
+        best = np.zeros(len(has_tags))
+        # Empty segments are left out: with them dropped, each start still runs to the end of its own tags
+        if has_tags.any():
+            best[has_tags] = np.maximum.reduceat(tag_scores, tag_offsets[:-1][has_tags])
+        return best
+    
+    def _calculate_relevance_score(self, idx: np.ndarray, query: str,
+                                   sort_by: str = "relevance",
+                                   title_scores: Optional[np.ndarray] = None,
+                                   composer_scores: Optional[np.ndarray] = None,
+                                   tag_scores: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Calculate relevance scores of the files at idx based on multiple factors
         Score range: 0-100
+        Field similarities come precomputed from _match_scores, one per file at idx (tags as the best)
         """
         if not query.strip():
             # No query, use alternative ranking
             if sort_by == "popularity":
-                return file.download_count / 100  # Normalize
+                return self._downloads[idx] / 100  # Normalize
             elif sort_by == "rating":
-                return file.user_rating * 20
+                return self._rating[idx] * 20
             elif sort_by == "quality":
-                return file.quality_score * 10
+                return self._quality[idx] * 10
             elif sort_by == "recent":
-                return 50  # Would use date_added in real implementation
-            return file.quality_score * 10
+                return np.full(len(idx), 50.0)  # Would use date_added in real implementation
+            return self._quality[idx] * 10
         
+        # Genre and period hits depend only on the enum, so test each value once and gather
         query_lower = query.lower()
-        score = 0.0
-        
-        # Title match (40 points max)
-        title_match = self._fuzzy_match(query, file.title)
-        if title_match > 0.6:
-            score += title_match * 40
-        
-        # Composer match (30 points max)
-        normalized_query = self._normalize_composer(query)
-        composer_match = self._fuzzy_match(normalized_query, file.composer)
-        if composer_match > 0.6:
-            score += composer_match * 30
-        
-        # Tag match (15 points max)
-        tag_matches = [self._fuzzy_match(query, tag) for tag in file.tags]
-        if tag_matches:
-            best_tag_match = max(tag_matches)
-            if best_tag_match > 0.6:
-                score += best_tag_match * 15
-        
-        # Genre match (10 points max)
-        if query_lower in file.genre.value.lower():
-            score += 10
-        
-        # Period match (5 points max)
-        if file.period and query_lower in file.period.value.lower():
-            score += 5
-        
-        # Quality boost (multiply by quality factor)
-        quality_factor = 0.5 + (file.quality_score / 20)  # 0.5 to 1.0
-        score *= quality_factor
-        
-        # Popularity boost (small influence)
-        popularity_factor = min(file.download_count / 10000, 0.2)  # Max 0.2 boost
-        score *= (1 + popularity_factor)
-        
-        # User rating boost
-        rating_factor = (file.user_rating / 5) * 0.1  # Max 0.1 boost
-        score *= (1 + rating_factor)
-        
-        return score
+        genre_hits = np.array([query_lower in name for name in GENRE_NAMES])
+        # The trailing False is picked up by files without a period (code -1)
+        period_hits = np.array([query_lower in name for name in PERIOD_NAMES] + [False])
+        
+        return _score_kernel(
+            title_scores, composer_scores, tag_scores,
+            genre_hits[self._genre[idx]], period_hits[self._period[idx]],
+            self._quality[idx], self._downloads[idx], self._rating[idx],
+        )
     
-    def _apply_filters(self, file: MIDIFile, filters: SearchFilters) -> bool:
-        """Check if file passes all filters"""
-        if filters.difficulty and file.difficulty not in filters.difficulty:
-            return False
-        
-        if filters.genre and file.genre not in filters.genre:
-            return False
-        
-        if filters.period and (not file.period or file.period not in filters.period):
-            return False
-        
-        if filters.tempo_min and file.tempo < filters.tempo_min:
-            return False
-        
-        if filters.tempo_max and file.tempo > filters.tempo_max:
-            return False
-        
-        if filters.duration_min and file.duration < filters.duration_min:
-            return False
-        
-        if filters.duration_max and file.duration > filters.duration_max:
-            return False
+    @staticmethod
+    def _lookup_table(codes: List[int], size: int) -> np.ndarray:
+        table = np.zeros(size, dtype=bool)
+        table[codes] = True
+        return table
+    
+    def _apply_filters(self, filters: SearchFilters) -> np.ndarray:
+        """Return the indices of the files that pass all filters"""
+        n = max(len(self.files), 1)
+        # (share of the corpus the filter keeps, column, test over column values)
+        predicates = []
+        
+        # Enum filters become lookup tables indexed by code, so membership is a single gather
+        if filters.difficulty:
+            difficulties = self._lookup_table([d.value for d in filters.difficulty], len(self._difficulty_counts))
+            share = self._difficulty_counts[difficulties].sum() / n
+            predicates.append((share, self._difficulty, difficulties.__getitem__))
+        
+        if filters.genre:
+            genres = self._lookup_table([GENRE_CODES[g] for g in filters.genre], len(Genre))
+            share = self._genre_counts[genres].sum() / n
+            predicates.append((share, self._genre, genres.__getitem__))
+        
+        if filters.period:
+            # The extra last entry stays False: files without a period (-1) never match
+            periods = self._lookup_table([PERIOD_CODES[p] for p in filters.period], len(Period) + 1)
+            # _period_counts starts with the no-period count, hence the roll
+            share = self._period_counts[np.roll(periods, 1)].sum() / n
+            predicates.append((share, self._period, periods.__getitem__))
+        
+        if filters.tempo_min:
+            share = 1 - np.searchsorted(self._tempo_sorted, filters.tempo_min) / n
+            predicates.append((share, self._tempo, lambda v: v >= filters.tempo_min))
+        
+        if filters.tempo_max:
+            share = np.searchsorted(self._tempo_sorted, filters.tempo_max, side='right') / n
+            predicates.append((share, self._tempo, lambda v: v <= filters.tempo_max))
+        
+        if filters.duration_min:
+            share = 1 - np.searchsorted(self._duration_sorted, filters.duration_min) / n
+            predicates.append((share, self._duration, lambda v: v >= filters.duration_min))
+        
+        if filters.duration_max:
+            share = np.searchsorted(self._duration_sorted, filters.duration_max, side='right') / n
+            predicates.append((share, self._duration, lambda v: v <= filters.duration_max))
         
         if filters.file_format:
             if filters.file_format == 'both':
-                if not ('midi' in file.file_formats and 'musicxml' in file.file_formats):
-                    return False
-            elif filters.file_format not in file.file_formats:
-                return False
-        
-        if filters.min_quality and file.quality_score < filters.min_quality:
-            return False
-        
-        return True
+                needed = FORMAT_BITS['midi'] | FORMAT_BITS['musicxml']
+            else:
+                needed = FORMAT_BITS.get(filters.file_format)
+            if needed is None:
+                # Formats outside FORMAT_BITS have no column; test the files' format lists directly
+                has_format = np.fromiter(
+                    (filters.file_format in f.file_formats for f in self.files), dtype=bool, count=len(self.files)
+                )
+                predicates.append((has_format.sum() / n, has_format, lambda v: v))
+            else:
+                share = self._format_counts[[m for m in range(len(self._format_counts)) if m & needed == needed]].sum() / n
+                predicates.append((share, self._formats, lambda v: (v & needed) == needed))
+        
+        if filters.min_quality:
+            share = 1 - np.searchsorted(self._quality_sorted, filters.min_quality) / n
+            predicates.append((share, self._quality, lambda v: v >= filters.min_quality))
+        
+        # Most selective filter first: each later one only tests the files still in the running
+        idx = np.arange(len(self.files))
+        for _, column, test in sorted(predicates, key=lambda predicate: predicate[0]):
+            idx = idx[test(column[idx])]
+            if not len(idx):
+                break
+        return idx
     
-    def _get_match_highlights(self, file: MIDIFile, query: str) -> Dict[str, str]:
-        """Return which fields matched the query"""
-        highlights = {}
-        query_lower = query.lower()
+    def _get_match_highlights(self, file: MIDIFile, title_match: float, composer_match: float,
+                              tag_matches: np.ndarray) -> Highlights:
+        """Return which fields matched the query, given the file's precomputed similarities"""
+        highlights = Highlights()
         
-        if self._fuzzy_match(query, file.title) > 0.6:
-            highlights['title'] = file.title
+        if title_match > 0.6:
+            highlights.title = file.title
         
-        normalized_query = self._normalize_composer(query)
-        if self._fuzzy_match(normalized_query, file.composer) > 0.6:
-            highlights['composer'] = file.composer
+        if composer_match > 0.6:
+            highlights.composer = file.composer
         
-        for tag in file.tags:
-            if self._fuzzy_match(query, tag) > 0.6:
-                highlights['tags'] = tag
+        for tag, tag_match in zip(file.tags, tag_matches):
+            if tag_match > 0.6:
+                highlights.tag = tag
                 break
         
         return highlights
@@ -249,64 +425,76 @@ class MIDISearchEngine:
         if filters is None:
             filters = SearchFilters()
         
-        results = []
+        # Filter, then score the files that pass
+        idx = self._apply_filters(filters)
         
-        # Filter and score all files
-        for file in self.files:
-            # Apply filters
-            if not self._apply_filters(file, filters):
-                continue
-            
-            # Calculate relevance
-            relevance = self._calculate_relevance_score(file, query, sort_by)
+        # Score the query against the titles, composers and tags of those files only
+        if query:
+            title_scores, composer_scores, tag_scores, tag_offsets = self._match_scores(query, idx)
+            relevance = self._calculate_relevance_score(
+                idx, query, sort_by, title_scores, composer_scores, self._best_tag_scores(tag_scores, tag_offsets)
+            )
+        else:
+            relevance = self._calculate_relevance_score(idx, query, sort_by)
+        
+        # Sort results by argsort over the precomputed (already lowercased) columns; a stable sort
+        # on the negated column keeps ties in corpus order for descending sorts too
+        if sort_by == "relevance":
+            order = np.argsort(-relevance, kind='stable')
+        elif sort_by in SORT_COLUMNS:
+            name, descending = SORT_COLUMNS[sort_by]
+            column = getattr(self, name)[idx]
+            order = np.argsort(-column if descending else column, kind='stable')
+        else:
+            order = np.arange(len(idx))
+        
+        # Pagination; results and highlights are only built for the returned page
+        results = []
+        for j in order[offset:offset + limit]:
+            i = idx[j]
+            file = self.files[i]
             
             # Get match highlights
-            highlights = self._get_match_highlights(file, query) if query else {}
+            if query:
+                tag_matches = tag_scores[tag_offsets[j]:tag_offsets[j + 1]]
+                highlights = self._get_match_highlights(file, title_scores[j], composer_scores[j], tag_matches)
+            else:
+                highlights = Highlights()
             
             results.append(SearchResult(
                 file=file,
-                relevance_score=relevance,
+                relevance_score=float(relevance[j]),
                 match_highlights=highlights
             ))
         
-        # Sort results
-        if sort_by == "relevance":
-            results.sort(key=lambda x: x.relevance_score, reverse=True)
-        elif sort_by == "popularity":
-            results.sort(key=lambda x: x.file.download_count, reverse=True)
-        elif sort_by == "rating":
-            results.sort(key=lambda x: x.file.user_rating, reverse=True)
-        elif sort_by == "quality":
-            results.sort(key=lambda x: x.file.quality_score, reverse=True)
-        elif sort_by == "title":
-            results.sort(key=lambda x: x.file.title.lower())
-        elif sort_by == "composer":
-            results.sort(key=lambda x: x.file.composer.lower())
-        elif sort_by == "recent":
-            results.sort(key=lambda x: x.file.date_added, reverse=True)
-        
-        # Pagination
-        return results[offset:offset + limit]
+        return results
     
     def autocomplete(self, query: str, limit: int = 10) -> List[str]:
         """Provide autocomplete suggestions"""
         if len(query) < 2:
             return []
         
-        suggestions = set()
         query_lower = query.lower()
         
-        # Suggest titles
-        for file in self.files:
-            if query_lower in file.title.lower():
-                suggestions.add(file.title)
-            if query_lower in file.composer.lower():
-                suggestions.add(file.composer)
-            for tag in file.tags:
-                if query_lower in tag.lower():
-                    suggestions.add(tag)
-        
-        return sorted(list(suggestions))[:limit]
+        # Anything containing the query also contains each substring of it, so as the user types on,
+        # only the previous keystroke's matches need checking
+        last_query, last_matches = self._last_autocomplete
+        if last_query and last_query in query_lower:
+            candidates = last_matches
+        else:
+            # Candidates contain every trigram of the query; two-letter queries have none and check everything
+            trigrams = self._trigrams_of(query_lower)
+            if trigrams:
+                postings = [self._trigrams.get(trigram, set()) for trigram in trigrams]
+                candidates = set.intersection(*postings)
+            else:
+                candidates = range(len(self._suggestions))
+        
+        # Titles, composers and tags that contain the query
+        matches = [i for i in candidates if query_lower in self._suggestions_lower[i]]
+        self._last_autocomplete = (query_lower, matches)
+        
+        return sorted(self._suggestions[i] for i in matches)[:limit]
 
 
 # Example usage
@@ -378,7 +566,7 @@ if __name__ == "__main__":
     for result in results:
         print(f"{result.file.title} by {result.file.composer}")
         print(f"  Relevance: {result.relevance_score:.2f}")
-        print(f"  Matches: {result.match_highlights}")
+        print(f"  Matches: {result.match_highlights.to_dict()}")
         print()
     
     print("\n=== Search: 'beginner piano' with filters ===")